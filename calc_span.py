@@ -3,6 +3,8 @@
 from itertools import product
 from collections import Counter
 import math # float('inf') を使うため
+from functools import lru_cache
+import os
 
 def round_to_nearest_5mm(value):
     """5mm単位で丸める関数"""
@@ -21,6 +23,7 @@ TIE_COLUMN_MIN_HEIGHT_FOR_LARGE_REDUCTION = 550
 TIE_COLUMN_MIN_HEIGHT_FOR_SMALL_REDUCTION = 150
 
 normal_parts = [1800, 1500, 1200, 900, 600] # これが「追加で選択可能な通常部材」のマスターリスト
+correction_parts = [150, 300, 355, 600, 900] # 軒の出に届かない側に付ける補正部材 "(+N)" の候補
 
 def base_width(width, unit=STANDARD_PART_SIZE):
     return width - (width % unit)
@@ -194,15 +197,111 @@ def calculate_span_with_boundaries(width, eaves,
     return base, final_parts, final_total_span
 
 
+@lru_cache(maxsize=None)
+def _normal_part_sums(available_normal_parts_tuple, max_items=4):
+    """通常部材 0〜max_items 個の組み合わせを合計値ごとに 1 つへ集約する (部材数が少なく 1800 が多いものを残す)"""
+    best_by_sum = {}
+    for r_count in range(0, max_items + 1):
+        for combo in product(available_normal_parts_tuple, repeat=r_count):
+            current_sum = sum(combo)
+            best = best_by_sum.get(current_sum)
+            if best is None or len(combo) < len(best) or \
+               (len(combo) == len(best) and combo.count(STANDARD_PART_SIZE) > best.count(STANDARD_PART_SIZE)):
+                best_by_sum[current_sum] = combo
+    return best_by_sum
+
+def calculate_span_with_corrections(width, eaves_left, eaves_right,
+                                    mandatory_special_parts, available_normal_parts_list,
+                                    left_boundary=None, right_boundary=None,
+                                    target_margin=DEFAULT_TARGET_MARGIN, debug_prints=False):
+    """補正部材を決定変数に含めて総スパンと離れを同時に決める。
+
+    各側の離れは 0〜(境界 - BOUNDARY_OFFSET) に収め、離れ + 補正部材 >= 軒の出 + EAVES_MARGIN_THRESHOLD_ADDITION
+    を両側で満たす構成のうち、(補正部材数, 目標離れからのずれ, 総部材数, 1800 の少なさ) が最小のものを選ぶ。
+    離れは 5mm 単位で探索する (総スパン - 躯体幅が 5 の倍数でなければ、左右どちらか一方が端数を含む)。
+    補正数が最良解を超える組み合わせは打ち切るため、探索は部材合計ごとに補正候補の組み合わせ数程度で済む。
+    戻り値は (base, parts, total_span, left_gap, right_gap, left_corr, right_corr)。
+    補正不要な側の補正値は None。条件を満たす構成がなければ None を返す。
+    """
+    base = base_width(width)
+    sum_of_mandatory_special = sum(mandatory_special_parts)
+    threshold_l = eaves_left + EAVES_MARGIN_THRESHOLD_ADDITION
+    threshold_r = eaves_right + EAVES_MARGIN_THRESHOLD_ADDITION
+
+    max_allowed_l = (left_boundary - BOUNDARY_OFFSET) if left_boundary is not None else float('inf')
+    if max_allowed_l < 0: max_allowed_l = 0
+    max_allowed_r = (right_boundary - BOUNDARY_OFFSET) if right_boundary is not None else float('inf')
+    if max_allowed_r < 0: max_allowed_r = 0
+    effective_target_l = min(target_margin, max_allowed_l)
+    effective_target_r = min(target_margin, max_allowed_r)
+
+    # 補正候補 (補正なし = 0 を含む、昇順)。部材数は補正ありの側ごとに 1
+    correction_options = [0] + sorted(correction_parts)
+    # 右側: 必要離れが 0 になる最小の補正までで十分 (それ以上は左の取りうる範囲が変わらない)
+    right_options = []
+    for corr in correction_options:
+        right_options.append(corr)
+        if threshold_r - corr <= 0: break
+    min_sum_normal_for_width_coverage = max(0, width - base - sum_of_mandatory_special)
+    max_sum_normal = width + max_allowed_l + max_allowed_r - base - sum_of_mandatory_special
+
+    best_key = None; best_layout = None
+    for current_sum_normal, combo_normal in _normal_part_sums(tuple(available_normal_parts_list)).items():
+        if current_sum_normal < min_sum_normal_for_width_coverage or current_sum_normal > max_sum_normal:
+            continue
+        total = base + sum_of_mandatory_special + current_sum_normal
+        margin_space = total - width
+        for corr_r in right_options:
+            if best_key is not None and (corr_r > 0) > best_key[0]:
+                break # 補正数が現在の最良解を超える
+            # 左の離れの上限 (境界・右側の条件から逆算)
+            hi = min(max_allowed_l, margin_space - max(0, threshold_r - corr_r))
+            # 左の補正は昇順に試し、補正数が最良解を超えた時点で打ち切る
+            # (補正ありの候補はどれも補正数が同じなので、ずれの小さい大きめの補正も比較する)
+            for corr_l in correction_options:
+                if threshold_l - corr_l > hi:
+                    continue
+                num_corrections = (corr_l > 0) + (corr_r > 0)
+                if best_key is not None and num_corrections > best_key[0]:
+                    break
+                lo = max(0, threshold_l - corr_l, margin_space - max_allowed_r)
+                # 左右どちらかの離れが 5mm 単位になる左離れだけを探索する (剰余 0: 左, 剰余 margin_space % 5: 右)
+                for residue in sorted({0, margin_space % 5}):
+                    grid_lo = lo + (residue - lo) % 5
+                    grid_hi = hi - (hi - residue) % 5
+                    if grid_lo > grid_hi:
+                        continue
+                    # ずれは左離れについて凸な折れ線なので、折れ点 (左右の目標) 前後の格子点をクリップして比べれば足りる
+                    for breakpoint in (effective_target_l, margin_space - effective_target_r):
+                        below = breakpoint - (breakpoint - residue) % 5
+                        for gap_l in (max(grid_lo, min(below, grid_hi)), max(grid_lo, min(below + 5, grid_hi))):
+                            deviation = abs(gap_l - effective_target_l) + abs(margin_space - gap_l - effective_target_r)
+                            key = (num_corrections, deviation, len(combo_normal) + num_corrections,
+                                   -combo_normal.count(STANDARD_PART_SIZE), corr_l + corr_r)
+                            if best_key is None or key < best_key:
+                                best_key = key
+                                best_layout = (combo_normal, total, gap_l, margin_space - gap_l, corr_l, corr_r)
+
+    if best_layout is None:
+        if debug_prints: print(f"[DEBUG CSC] No feasible layout (thresholds L={threshold_l}, R={threshold_r}, max_allowed L={max_allowed_l}, R={max_allowed_r})")
+        return None
+    combo_normal, total, gap_l, gap_r, corr_l, corr_r = best_layout
+    final_parts = sorted(list(mandatory_special_parts) + list(combo_normal), reverse=True)
+    if debug_prints: print(f"[DEBUG CSC] Selected: base={base}, final_parts={final_parts}, total_span={total}, L={gap_l}(+{corr_l}), R={gap_r}(+{corr_r}), key={best_key}")
+    return base, final_parts, total, int(gap_l), int(gap_r), (corr_l or None), (corr_r or None)
+
+
 def calculate_face_dimensions(
     width_val,
     eaves_left_val, eaves_right_val,
     boundary_left_val, boundary_right_val,
     use_150_val, use_300_val, use_355_val,
     parts_master_list, target_margin_val=DEFAULT_TARGET_MARGIN, # parts_master_list は normal_parts グローバル変数
-    face_name="UnknownFace"
+    face_name="UnknownFace", solve_mode="sequential", # "joint" で補正部材込みの同時探索
+    debug_prints=True # True にするとこの関数内のデバッグプリントが有効になる
 ):
-    debug_prints = True # True にするとこの関数内のデバッグプリントが有効になる
+    if solve_mode not in ("sequential", "joint"):
+        raise ValueError(f"solve_mode は 'sequential' または 'joint' を指定してください: {solve_mode!r}")
     if debug_prints: print(f"\n--- Calculating for {face_name} ---")
     if debug_prints: print(f"[DEBUG {face_name}] Inputs: width={width_val}, eaves_L={eaves_left_val}, eaves_R={eaves_right_val}, bound_L={boundary_left_val}, bound_R={boundary_right_val}, target_margin={target_margin_val}")
 
@@ -213,6 +312,25 @@ def calculate_face_dimensions(
     for p_spec, count_spec in ((150, use_150_val), (300, use_300_val), (355, use_355_val)):
         mandatory_special_parts.extend([p_spec] * count_spec)
     
+    # joint モード: 補正部材も決定変数としてスパン探索に含める。解なしなら従来の逐次計算へ
+    if solve_mode == "joint":
+        joint_result = calculate_span_with_corrections(
+            width_val, eaves_left_val, eaves_right_val,
+            mandatory_special_parts, parts_master_list,
+            boundary_left_val, boundary_right_val,
+            target_margin=target_margin_val, debug_prints=debug_prints
+        )
+        if joint_result is not None:
+            base_val, parts_val, total_val, left_margin, right_margin, corr_left, corr_right = joint_result
+            if debug_prints: print(f"[DEBUG {face_name}] Joint solve: total_span={total_val}, L={left_margin}(+{corr_left}), R={right_margin}(+{corr_right})")
+            return _format_face_result(
+                face_name, base_val, parts_val, total_val,
+                left_margin, right_margin, # 探索時に 5mm 単位へ寄せ済み。再丸めすると条件を外れうる
+                eaves_left_val + EAVES_MARGIN_THRESHOLD_ADDITION, eaves_right_val + EAVES_MARGIN_THRESHOLD_ADDITION,
+                corr_left, corr_right, debug_prints=debug_prints
+            )
+        if debug_prints: print(f"[DEBUG {face_name}] Joint solve found no feasible layout. Falling back to sequential.")
+
     # 2. calculate_span_with_boundaries を呼び出し、最適な総スパンと部材構成を得る
     #    この関数は必須特殊部材を考慮し、残りを通常部材で補って target_margin を目指す
     base_val, parts_val, total_val = calculate_span_with_boundaries(
@@ -332,7 +450,7 @@ def calculate_face_dimensions(
     correction_part_val = None; corr_val_for_left_note_str = None; corr_val_for_right_note_str = None
 
     if needs_correction_flag:
-        candidates = [150, 300, 355, 600, 900]
+        candidates = correction_parts
         if original_left_margin < threshold_left:
             for p_corr in candidates:
                 if original_left_margin + p_corr >= threshold_left: corr_val_for_left_note_str = p_corr; break
@@ -346,6 +464,22 @@ def calculate_face_dimensions(
         elif corr_val_for_right_note_str: correction_part_val = corr_val_for_right_note_str
         if debug_prints: print(f"[DEBUG {face_name}] Needs correction. L_corr_note={corr_val_for_left_note_str}, R_corr_note={corr_val_for_right_note_str}, span_text_corr_val={correction_part_val}")
 
+    return _format_face_result(
+        face_name, base_val, parts_val, total_val,
+        original_left_margin, original_right_margin, threshold_left, threshold_right,
+        corr_val_for_left_note_str, corr_val_for_right_note_str, debug_prints=debug_prints
+    )
+
+def _format_face_result(face_name, base_val, parts_val, total_val,
+                        original_left_margin, original_right_margin, threshold_left, threshold_right,
+                        corr_val_for_left_note_str, corr_val_for_right_note_str, debug_prints=False):
+    """確定したスパン・離れ・補正値から、スパン構成テキストと離れ表記を組み立てる"""
+    needs_correction_flag = corr_val_for_left_note_str is not None or corr_val_for_right_note_str is not None
+    correction_part_val = None
+    if corr_val_for_left_note_str and corr_val_for_right_note_str: correction_part_val = max(corr_val_for_left_note_str, corr_val_for_right_note_str)
+    elif corr_val_for_left_note_str: correction_part_val = corr_val_for_left_note_str
+    elif corr_val_for_right_note_str: correction_part_val = corr_val_for_right_note_str
+
     # parts_val は calculate_span_with_boundaries から返された、必須特殊部材と追加通常部材のリスト
     base_parts_for_format = [STANDARD_PART_SIZE] * (base_val // STANDARD_PART_SIZE)
     combined_parts_for_format = base_parts_for_format + parts_val # parts_val には既に base に対応しない調整部材が入っている
@@ -377,7 +511,8 @@ def calculate_face_dimensions(
     
     if debug_prints: print(f"[DEBUG {face_name}] Final Notes: L='{left_note_str}', R='{right_note_str}' | Span Text='{span_parts_text}'")
     if debug_prints: print(f"--- End Calculating for {face_name} ---\n")
-    return total_val, span_parts_text, original_left_margin, original_right_margin, left_note_str, right_note_str
+    return (total_val, span_parts_text, original_left_margin, original_right_margin, left_note_str, right_note_str,
+            corr_val_for_left_note_str, corr_val_for_right_note_str)
 
 # calc_all 関数 (ユーザー提供のものをベースに、段数計算などを統合)
 def calc_all(
@@ -387,29 +522,33 @@ def calc_all(
     standard_height, roof_shape, tie_column, railing_count,
     use_355_NS=0, use_300_NS=0, use_150_NS=0,
     use_355_EW=0, use_300_EW=0, use_150_EW=0,
-    target_margin=DEFAULT_TARGET_MARGIN
+    target_margin=DEFAULT_TARGET_MARGIN, solve_mode="sequential", debug_prints=True
 ):
     global normal_parts # グローバルな通常部材リストを参照
 
     # 南北方向の計算（東面・西面の離れを決定）
-    ns_total_val, span_text_ns, _, _, east_note, west_note = calculate_face_dimensions(
+    (ns_total_val, span_text_ns, east_margin, west_margin, east_note, west_note,
+     east_corr, west_corr) = calculate_face_dimensions(
         width_val=width_NS,
         eaves_left_val=eaves_E, eaves_right_val=eaves_W,
         boundary_left_val=boundary_E, boundary_right_val=boundary_W,
         use_150_val=use_150_NS, use_300_val=use_300_NS, use_355_val=use_355_NS,
         parts_master_list=normal_parts, # 通常部材のマスターリストを渡す
         target_margin_val=target_margin,
-        face_name="NS_direction (East/West gaps)"
+        face_name="NS_direction (East/West gaps)", solve_mode=solve_mode,
+        debug_prints=debug_prints
     )
     # 東西方向の計算（北面・南面の離れを決定）
-    ew_total_val, span_text_ew, _, _, south_note, north_note = calculate_face_dimensions(
+    (ew_total_val, span_text_ew, south_margin, north_margin, south_note, north_note,
+     south_corr, north_corr) = calculate_face_dimensions(
         width_val=width_EW,
         eaves_left_val=eaves_S, eaves_right_val=eaves_N,
         boundary_left_val=boundary_S, boundary_right_val=boundary_N,
         use_150_val=use_150_EW, use_300_val=use_300_EW, use_355_val=use_355_EW,
         parts_master_list=normal_parts, # 通常部材のマスターリストを渡す
         target_margin_val=target_margin,
-        face_name="EW_direction (North/South gaps)"
+        face_name="EW_direction (North/South gaps)", solve_mode=solve_mode,
+        debug_prints=debug_prints
     )
 
     # 段数とジャッキアップ高さ計算 (ユーザー提供の calc_span.py から)
@@ -456,12 +595,117 @@ def calc_all(
         "ns_span_structure": span_text_ns, "ew_span_structure": span_text_ew,
         "north_gap": north_note, "south_gap": south_note,
         "east_gap": east_note, "west_gap": west_note,
+        # 離れ・補正値の数値版 (補正不要なら 0)。バッチ出力の列として使う
+        "north_margin": north_margin, "south_margin": south_margin,
+        "east_margin": east_margin, "west_margin": west_margin,
+        "north_correction": north_corr or 0, "south_correction": south_corr or 0,
+        "east_correction": east_corr or 0, "west_correction": west_corr or 0,
         "num_stages": num_stages, "modules_count": modules_count,
         "jack_up_height": jack_up_height, "first_layer_height": first_layer_height,
         "tie_ok": tie_possible, "tie_column_used": tie_column
     }
     return result
 
+# --- バッチ計算と列指向バイナリ出力 ---
+# calc_all の結果をフィールドごとの配列 (列) として保存する。
+# 数値列はネイティブ型、文字列列は固定長ユニコード配列 (pickle 不要)。
+RESULT_NUMERIC_COLUMNS = {
+    "ns_total_span": "int32", "ew_total_span": "int32",
+    "north_margin": "int32", "south_margin": "int32",
+    "east_margin": "int32", "west_margin": "int32",
+    "north_correction": "int16", "south_correction": "int16",
+    "east_correction": "int16", "west_correction": "int16",
+    "num_stages": "int16", "modules_count": "int16",
+    "jack_up_height": "int32", "first_layer_height": "int32",
+    "tie_ok": "bool", "tie_column_used": "bool",
+}
+RESULT_TEXT_COLUMNS = (
+    "ns_span_structure", "ew_span_structure",
+    "north_gap", "south_gap", "east_gap", "west_gap",
+)
+
+# numpy / pyarrow は列指向出力でのみ使う任意依存。単発計算の import を重くしないよう使う時に読み込む
+def _require_numpy():
+    try:
+        import numpy as np
+    except ImportError:
+        raise ImportError("列指向出力には numpy が必要です (pip install numpy)") from None
+    return np
+
+def _require_pyarrow():
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise ImportError("Parquet 出力には pyarrow が必要です (pip install pyarrow)") from None
+    return pa, pq
+
+def calc_batch(params_list, debug_prints=False):
+    """calc_all をパラメータ辞書のリストに適用し、結果辞書のリストを返す (既定でデバッグ出力なし)
+
+    パラメータ辞書に debug_prints があればそちらを優先する。
+    """
+    return [calc_all(**{"debug_prints": debug_prints, **params}) for params in params_list]
+
+def results_to_columns(results):
+    """calc_all の結果リストを {フィールド名: numpy配列} の列形式に変換する"""
+    np = _require_numpy()
+    columns = {}
+    for name, dtype in RESULT_NUMERIC_COLUMNS.items():
+        columns[name] = np.fromiter((r[name] for r in results), dtype=dtype, count=len(results))
+    for name in RESULT_TEXT_COLUMNS:
+        columns[name] = np.array([r[name] for r in results], dtype=np.str_)
+    return columns
+
+def write_results_npy(results, directory):
+    """フィールドごとに <directory>/<フィールド名>.npy を書き出す (load_results_npy でメモリマップ可能)"""
+    np = _require_numpy()
+    columns = results_to_columns(results)
+    os.makedirs(directory, exist_ok=True)
+    for name, array in columns.items():
+        np.save(os.path.join(directory, f"{name}.npy"), array, allow_pickle=False)
+    return directory
+
+def load_results_npy(directory, fields=None, mmap_mode="r"):
+    """write_results_npy の出力を読み込む。既定では読み取り専用のメモリマップ (ゼロコピー)
+
+    fields を指定した場合、存在しないフィールドは FileNotFoundError。
+    fields 省略時は既知の全フィールドのうち、ファイルがあるものだけを読み込む。
+    """
+    np = _require_numpy()
+    tolerate_missing = fields is None
+    if fields is None:
+        fields = list(RESULT_NUMERIC_COLUMNS) + list(RESULT_TEXT_COLUMNS)
+    columns = {}
+    for name in fields:
+        path = os.path.join(directory, f"{name}.npy")
+        if not os.path.exists(path):
+            if tolerate_missing: continue
+            raise FileNotFoundError(f"フィールド '{name}' のファイルがありません: {path}")
+        columns[name] = np.load(path, mmap_mode=mmap_mode, allow_pickle=False)
+    return columns
+
+def write_results_npz(results, path, compressed=False):
+    """全フィールドを 1 つの .npz にまとめて書き出す (npz はメモリマップ不可。転送・保管用)
+
+    拡張子がなければ numpy と同じく .npz を付け、実際に書き出したパスを返す。
+    """
+    np = _require_numpy()
+    columns = results_to_columns(results)
+    path = os.fspath(path)
+    if not path.endswith(".npz"): path += ".npz"
+    if compressed: np.savez_compressed(path, **columns)
+    else: np.savez(path, **columns)
+    return path
+
+def write_results_parquet(results, path):
+    """Parquet で書き出す (pyarrow がインストールされている場合のみ)"""
+    pa, pq = _require_pyarrow()
+    columns = results_to_columns(results)
+    table = pa.table({name: pa.array(array) for name, array in columns.items()})
+    pq.write_table(table, path)
+    return path
+
 # グローバルな normal_parts の定義はファイルの末尾のまま (ユーザー提供の元のコードより)
 # normal_parts = [1800, 1500, 1200, 900, 600] # これはファイルの先頭に移動済み
 
@@ -0,0 +1,192 @@
+"""calc_span.py のバッチ計算・列指向出力・joint 探索の確認テスト"""
+
+import random
+
+import pytest
+
+import calc_span
+
+SAMPLE_PARAMS = {
+    "width_NS": 10010, "width_EW": 9100,
+    "eaves_N": 500, "eaves_E": 500, "eaves_S": 500, "eaves_W": 500,
+    "boundary_N": 640, "boundary_E": None, "boundary_S": 600, "boundary_W": None,
+    "standard_height": 6250, "roof_shape": "勾配軒",
+    "tie_column": True, "railing_count": 3,
+    "use_355_NS": 1, "use_300_NS": 0, "use_150_NS": 1,
+    "target_margin": 1000,
+}
+
+
+def sample_batch():
+    no_boundary = dict(SAMPLE_PARAMS, boundary_N=None, boundary_S=None, tie_column=False)
+    return calc_span.calc_batch([SAMPLE_PARAMS, no_boundary, dict(SAMPLE_PARAMS, standard_height=9000)])
+
+
+def test_calc_batch_prints_nothing_by_default(capsys):
+    results = sample_batch()
+    assert len(results) == 3
+    assert capsys.readouterr().out == ""
+
+
+def test_calc_batch_accepts_debug_prints_in_params(capsys):
+    calc_span.calc_batch([dict(SAMPLE_PARAMS, debug_prints=True)])
+    assert "[DEBUG" in capsys.readouterr().out
+
+
+def test_npy_round_trip(tmp_path):
+    np = pytest.importorskip("numpy")
+    results = sample_batch()
+    calc_span.write_results_npy(results, tmp_path)
+    columns = calc_span.load_results_npy(tmp_path)
+
+    for name, dtype in calc_span.RESULT_NUMERIC_COLUMNS.items():
+        assert isinstance(columns[name], np.memmap)
+        assert columns[name].dtype == np.dtype(dtype)
+        assert columns[name].tolist() == [r[name] for r in results]
+    for name in calc_span.RESULT_TEXT_COLUMNS:
+        assert isinstance(columns[name], np.memmap)
+        assert columns[name].tolist() == [r[name] for r in results]
+
+
+def test_npy_round_trip_empty(tmp_path):
+    pytest.importorskip("numpy")
+    calc_span.write_results_npy([], tmp_path)
+    columns = calc_span.load_results_npy(tmp_path, fields=["ns_total_span", "north_gap"])
+    assert len(columns["ns_total_span"]) == 0
+    assert len(columns["north_gap"]) == 0
+
+
+def test_load_results_npy_missing_field_raises(tmp_path):
+    pytest.importorskip("numpy")
+    calc_span.write_results_npy(sample_batch(), tmp_path)
+    with pytest.raises(FileNotFoundError):
+        calc_span.load_results_npy(tmp_path, fields=["nonexistent"])
+
+
+def test_npz_and_parquet_round_trip(tmp_path):
+    np = pytest.importorskip("numpy")
+    results = sample_batch()
+    npz_path = calc_span.write_results_npz(results, tmp_path / "results.npz")
+    with np.load(npz_path, allow_pickle=False) as npz:
+        assert npz["tie_ok"].dtype == np.bool_
+        assert npz["east_gap"].tolist() == [r["east_gap"] for r in results]
+
+    bare_path = calc_span.write_results_npz(results, tmp_path / "day1")
+    assert bare_path == str(tmp_path / "day1.npz")
+    with np.load(bare_path, allow_pickle=False) as npz:
+        assert npz["ns_total_span"].tolist() == [r["ns_total_span"] for r in results]
+
+    pq = pytest.importorskip("pyarrow.parquet")
+    table = pq.read_table(calc_span.write_results_parquet(results, tmp_path / "results.parquet"))
+    assert table.column("ns_total_span").to_pylist() == [r["ns_total_span"] for r in results]
+
+
+def _face(width, eaves_l, eaves_r, boundary_l, boundary_r, solve_mode):
+    return calc_span.calculate_face_dimensions(
+        width, eaves_l, eaves_r, boundary_l, boundary_r, 0, 0, 0, calc_span.normal_parts,
+        solve_mode=solve_mode, debug_prints=False
+    )
+
+
+def test_joint_solve_meets_thresholds_within_boundaries():
+    rng = random.Random(0)
+    checked = 0
+    for _ in range(1500):
+        width = rng.randint(3000, 15000)
+        eaves_l, eaves_r = rng.randint(0, 1000), rng.randint(0, 1000)
+        boundary_l = rng.choice([None, rng.randint(0, 1500)])
+        boundary_r = rng.choice([None, rng.randint(0, 1500)])
+        if calc_span.calculate_span_with_corrections(
+                width, eaves_l, eaves_r, [], calc_span.normal_parts, boundary_l, boundary_r) is None:
+            continue
+        checked += 1
+        _, _, left, right, _, _, corr_l, corr_r = _face(width, eaves_l, eaves_r, boundary_l, boundary_r, "joint")
+        for margin, corr, eaves, boundary in ((left, corr_l, eaves_l, boundary_l), (right, corr_r, eaves_r, boundary_r)):
+            assert margin + (corr or 0) >= eaves + calc_span.EAVES_MARGIN_THRESHOLD_ADDITION
+            assert 0 <= margin
+            if boundary is not None:
+                assert margin <= max(0, boundary - calc_span.BOUNDARY_OFFSET)
+        assert left % 5 == 0 or right % 5 == 0
+    assert checked > 1000
+
+
+def _joint_key(width, eaves_l, eaves_r, boundary_l, boundary_r, parts, gap_l, gap_r, corr_l, corr_r,
+               target_margin=calc_span.DEFAULT_TARGET_MARGIN):
+    """calculate_span_with_corrections と同じ評価キー"""
+    max_l = max(0, boundary_l - calc_span.BOUNDARY_OFFSET) if boundary_l is not None else float("inf")
+    max_r = max(0, boundary_r - calc_span.BOUNDARY_OFFSET) if boundary_r is not None else float("inf")
+    deviation = abs(gap_l - min(target_margin, max_l)) + abs(gap_r - min(target_margin, max_r))
+    num_corrections = (corr_l > 0) + (corr_r > 0)
+    return (num_corrections, deviation, len(parts) + num_corrections,
+            -parts.count(calc_span.STANDARD_PART_SIZE), corr_l + corr_r)
+
+
+def _brute_force_joint_key(width, eaves_l, eaves_r, boundary_l, boundary_r):
+    """全部材合計・全補正組み合わせ・全 5mm 格子離れを総当たりした最小キー"""
+    base = calc_span.base_width(width)
+    threshold_l = eaves_l + calc_span.EAVES_MARGIN_THRESHOLD_ADDITION
+    threshold_r = eaves_r + calc_span.EAVES_MARGIN_THRESHOLD_ADDITION
+    max_l = max(0, boundary_l - calc_span.BOUNDARY_OFFSET) if boundary_l is not None else float("inf")
+    max_r = max(0, boundary_r - calc_span.BOUNDARY_OFFSET) if boundary_r is not None else float("inf")
+    options = [0] + calc_span.correction_parts
+    best = None
+    for normal_sum, combo in calc_span._normal_part_sums(tuple(calc_span.normal_parts)).items():
+        margin_space = base + normal_sum - width
+        if margin_space < 0 or margin_space > max_l + max_r:
+            continue
+        grid_gaps = [gap_l for gap_l in set(range(0, margin_space + 1, 5)) | set(range(margin_space % 5, margin_space + 1, 5))
+                     if gap_l <= max_l and margin_space - gap_l <= max_r]
+        for corr_l in options:
+            for corr_r in options:
+                for gap_l in grid_gaps:
+                    gap_r = margin_space - gap_l
+                    if gap_l + corr_l < threshold_l or gap_r + corr_r < threshold_r:
+                        continue
+                    key = _joint_key(width, eaves_l, eaves_r, boundary_l, boundary_r, combo,
+                                     gap_l, gap_r, corr_l, corr_r)
+                    if best is None or key < best:
+                        best = key
+    return best
+
+
+def _solver_key(width, eaves_l, eaves_r, boundary_l, boundary_r):
+    result = calc_span.calculate_span_with_corrections(
+        width, eaves_l, eaves_r, [], calc_span.normal_parts, boundary_l, boundary_r)
+    if result is None:
+        return None
+    _, parts, _, gap_l, gap_r, corr_l, corr_r = result
+    return _joint_key(width, eaves_l, eaves_r, boundary_l, boundary_r, parts,
+                      gap_l, gap_r, corr_l or 0, corr_r or 0)
+
+
+@pytest.mark.parametrize("face", [
+    (5378, 1111, 116, 1156, None),
+    (9626, 1052, 704, 1183, 940),
+])
+def test_joint_solve_prefers_smaller_deviation_over_smaller_correction(face):
+    assert _solver_key(*face) == _brute_force_joint_key(*face)
+
+
+def test_joint_solve_matches_brute_force():
+    # 総当たりは境界なしだと重いので、片側は必ず境界ありにする
+    rng = random.Random(1)
+    for _ in range(20):
+        width = rng.randint(3000, 15000)
+        eaves_l, eaves_r = rng.randint(0, 1200), rng.randint(0, 1200)
+        boundary_l = rng.randint(0, 1500)
+        boundary_r = rng.choice([None, rng.randint(0, 1500)])
+        face = (width, eaves_l, eaves_r, boundary_l, boundary_r)
+        assert _solver_key(*face) == _brute_force_joint_key(*face), face
+
+
+def test_joint_solve_removes_correction_needed_by_sequential():
+    sequential = _face(11725, 722, 829, None, None, "sequential")
+    joint = _face(11725, 722, 829, None, None, "joint")
+    assert sequential[4:] == ("885 mm", "890 mm(+150)", None, 150)
+    assert joint[0] == sequential[0]
+    assert joint[4:] == ("865 mm", "910 mm", None, None)
+
+
+def test_unknown_solve_mode_raises():
+    with pytest.raises(ValueError):
+        _face(10010, 500, 500, None, None, "Joint")